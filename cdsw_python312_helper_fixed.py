@@ -4,116 +4,113 @@ CDSW Python 3.12 Helper (Fixed for Python 3.6 compatibility)
 ============================================================
 
 This version is compatible with Python 3.6 and later.
-The capture_output parameter was added in Python 3.7, so we use separate stdout/stderr parameters.
+python3.12 is located in-process (shutil.which, then a few fixed paths), so
+switching does not start a subprocess at all.
 """
 
-def switch_to_python312():
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+# Fallback locations checked when python3.12 is not on PATH
+COMMON_PY312_LOCATIONS = [
+    "/usr/bin/python3.12",
+    "/usr/local/bin/python3.12",
+    "/opt/python3.12/bin/python3.12"
+]
+
+# Set by exec_into_python312 so a python3.12 that is not really 3.12 cannot loop
+_REEXEC_ENV = "CDSW_PY312_REEXEC"
+
+# python3.12 path once found. A miss is not stored, so installing python3.12
+# after a failed switch and calling again picks it up.
+_found_paths = {}
+
+def _find_python312():
     """
-    Switch to Python 3.12 in current CDSW session
-    Run this function at the start of your session
+    Locate the python3.12 executable once per session.
+
+    Only a successful lookup is cached; after a miss the next call looks again.
+    """
+    if "python3.12" in _found_paths:
+        return _found_paths["python3.12"]
     
-    Compatible with Python 3.6+
+    # shutil.which walks PATH in-process, so no `which` subprocess is spawned
+    python312_path = shutil.which("python3.12")
+    if not python312_path:
+        # Stat the fallback locations concurrently; on NFS/FUSE-backed images each
+        # stat can take tens of milliseconds
+        def _executable(location):
+            if os.path.isfile(location) and os.access(location, os.X_OK):
+                return location
+            return None
+        
+        with ThreadPoolExecutor(max_workers=len(COMMON_PY312_LOCATIONS)) as executor:
+            hits = list(executor.map(_executable, COMMON_PY312_LOCATIONS))
+        python312_path = next((hit for hit in hits if hit), None)
+        if python312_path is None:
+            return None
+    
+    _found_paths["python3.12"] = python312_path
+    return python312_path
+
+def _prepend_path(directory):
+    """Move directory to the front of PATH, dropping empty and duplicate entries"""
+    parts = [directory] + os.environ.get('PATH', '').split(os.pathsep)
+    os.environ['PATH'] = os.pathsep.join(dict.fromkeys(p for p in parts if p))
+
+def _do_switch(verbose):
+    """
+    Shared body of switch_to_python312 (verbose=False) and
+    switch_to_python312_advanced (verbose=True, which reports every step)
     """
-    import os
     import sys
-    import subprocess
+    
+    if verbose:
+        print("=== Switching to Python 3.12 ===")
+        print(f"Current Python version: {sys.version}")
+        print(f"Current executable: {sys.executable}")
+    
+    if sys.version_info[:2] >= (3, 12):
+        if verbose:
+            print("✅ Already running Python 3.12, nothing to switch")
+        return True
     
     try:
-        # Find Python 3.12
-        # Using stdout and stderr parameters instead of capture_output for Python 3.6 compatibility
-        result = subprocess.run(["which", "python3.12"], 
-                              stdout=subprocess.PIPE, 
-                              stderr=subprocess.PIPE, 
-                              text=True, 
-                              check=True)
-        python312_path = result.stdout.strip()
+        # Find Python 3.12 on PATH, then in common locations (cached after the first lookup)
+        python312_path = _find_python312()
+        if not python312_path:
+            if verbose:
+                print("❌ Could not find python3.12 executable")
+                print("Please check if Python 3.12 is installed:")
+                print("   ls -la /usr/bin/python3*")
+            else:
+                print("❌ Failed to find python3.12 on PATH or in common locations")
+            return False
+        if verbose:
+            print(f"Found python3.12: {python312_path}")
         
         # Update sys.executable
+        original_executable = sys.executable
         sys.executable = python312_path
         
         # Update PATH
         python312_dir = os.path.dirname(python312_path)
-        current_path = os.environ.get('PATH', '')
-        os.environ['PATH'] = python312_dir + ":" + current_path
+        _prepend_path(python312_dir)
         
         # Set environment variables
-        os.environ['PY_PYTHON'] = '3.12'
-        os.environ['PYTHON_VERSION'] = '3.12'
-        
-        print(f"✅ Switched to Python 3.12: {sys.executable}")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Failed to find python3.12: {e}")
-        print(f"   stderr: {e.stderr}")
-        return False
+        os.environ.update(PY_PYTHON='3.12', PYTHON_VERSION='3.12')
     except Exception as e:
         print(f"❌ Failed to switch: {e}")
         return False
-
-def switch_to_python312_advanced():
-    """
-    Advanced version with more detailed error handling and fallbacks
-    """
-    import os
-    import sys
-    import subprocess
-    
-    print("=== Switching to Python 3.12 ===")
-    print(f"Current Python version: {sys.version}")
-    print(f"Current executable: {sys.executable}")
-    
-    # Try to find Python 3.12
-    python312_path = None
-    
-    # Method 1: Use which command
-    try:
-        result = subprocess.run(["which", "python3.12"], 
-                              stdout=subprocess.PIPE, 
-                              stderr=subprocess.PIPE, 
-                              text=True, 
-                              check=True)
-        python312_path = result.stdout.strip()
-        print(f"Found python3.12: {python312_path}")
-    except subprocess.CalledProcessError:
-        print("which python3.12 failed, trying alternatives...")
-    
-    # Method 2: Check common locations if which failed
-    if not python312_path:
-        common_locations = [
-            "/usr/bin/python3.12",
-            "/usr/local/bin/python3.12",
-            "/opt/python3.12/bin/python3.12"
-        ]
-        
-        for location in common_locations:
-            if os.path.exists(location):
-                python312_path = location
-                print(f"Found python3.12 at: {location}")
-                break
     
-    if not python312_path:
-        print("❌ Could not find python3.12 executable")
-        print("Please check if Python 3.12 is installed:")
-        print("   ls -la /usr/bin/python3*")
-        return False
+    if not verbose:
+        print(f"✅ Switched to Python 3.12: {sys.executable}")
+        return True
     
-    # Update sys.executable
-    original_executable = sys.executable
-    sys.executable = python312_path
     print(f"Updated sys.executable: {original_executable} → {sys.executable}")
-    
-    # Update PATH
-    python312_dir = os.path.dirname(python312_path)
-    current_path = os.environ.get('PATH', '')
-    old_path = current_path
-    os.environ['PATH'] = python312_dir + ":" + current_path
     print(f"Updated PATH to prioritize: {python312_dir}")
-    
-    # Set environment variables
-    os.environ['PY_PYTHON'] = '3.12'
-    os.environ['PYTHON_VERSION'] = '3.12'
     print("Set environment variables: PY_PYTHON=3.12, PYTHON_VERSION=3.12")
-    
     print(f"New Python version: {sys.version}")
     
     # Test Python 3.12 features
@@ -126,6 +123,62 @@ def switch_to_python312_advanced():
         print("⚠ Python 3.12 features not available (may still be using old version)")
         return True  # Still consider it a success since we updated the paths
 
+def switch_to_python312():
+    """
+    Switch to Python 3.12 in current CDSW session
+    Run this function at the start of your session
+    
+    This only updates sys.executable and environment variables, so child
+    processes use Python 3.12 while the running interpreter stays the same.
+    Use exec_into_python312() to actually restart under Python 3.12.
+    
+    Compatible with Python 3.6+
+    """
+    return _do_switch(False)
+
+def switch_to_python312_advanced():
+    """
+    Advanced version with more detailed error handling and fallbacks
+    """
+    return _do_switch(True)
+
+def exec_into_python312():
+    """
+    Replace the running process with Python 3.12, re-running the same script
+
+    On POSIX this uses os.execv, so the current interpreter image is replaced
+    in place and this function does not return. On Windows, where execv
+    spawns a new process anyway, the script is run in a child and this
+    process exits with its return code.
+
+    Returns True without restarting if already running Python 3.12, so it
+    is safe to call at the top of a script.
+    """
+    import subprocess
+    import sys
+    
+    if sys.version_info[:2] >= (3, 12):
+        # The restart worked; do not leave the guard for child processes
+        os.environ.pop(_REEXEC_ENV, None)
+        return True
+    if _REEXEC_ENV in os.environ:
+        print(f"❌ Restarted under python3.12 but still running Python {sys.version.split()[0]}")
+        return False
+    
+    python312_path = _find_python312()
+    if not python312_path:
+        print("❌ Could not find python3.12 executable")
+        return False
+    
+    argv = [python312_path] + sys.argv
+    os.environ[_REEXEC_ENV] = "1"
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if os.name == "posix":
+        os.execv(python312_path, argv)
+    sys.exit(subprocess.run(argv).returncode)
+
 # Usage examples:
 # switch_to_python312()           # Simple version
 # switch_to_python312_advanced()  # Verbose version with more details
+# exec_into_python312()           # Restart the current script under Python 3.12
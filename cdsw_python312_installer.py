@@ -10,11 +10,60 @@ Author: AI Assistant
 Date: 2025
 """
 
+import glob
+import importlib.util
 import os
+import re
+import shlex
 import sys
 import subprocess
 import shutil
-from pathlib import Path
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Default locations, resolved once at import time. Functions still expand a
+# caller-supplied "~/..." path, which is a no-op for these absolute defaults.
+DEFAULT_VENV = os.path.expanduser("~/venvs/py312")
+ACTIVATION_SCRIPT_PATH = os.path.expanduser("~/activate_py312.sh")
+
+# verify_python312_setup results, keyed by sys.executable
+_verify_cache = {}
+
+def _run(cmd, **kwargs):
+    """Run a command with the installer's default subprocess settings"""
+    # close_fds=False lets CPython launch the child via posix_spawn instead of
+    # fork()+exec(), which keeps spawn time flat in large CDSW processes
+    kwargs.setdefault("close_fds", False)
+    kwargs.setdefault("check", True)
+    kwargs.setdefault("capture_output", True)
+    kwargs.setdefault("text", True)
+    return subprocess.run(cmd, **kwargs)
+
+def _run_quiet(cmd, **kwargs):
+    """Run a command discarding stdout; only stderr is kept for error reports"""
+    return _run(cmd, capture_output=False, stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE, **kwargs)
+
+# pip output lines worth showing while a long install is running
+_PIP_PROGRESS_PATTERN = re.compile(r"^(Collecting|Installing|ERROR|WARNING)")
+
+def _run_streaming(cmd):
+    """Run a command, echoing pip progress lines as they arrive instead of buffering"""
+    errors = []
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, close_fds=False) as proc:
+        for line in proc.stdout:
+            if _PIP_PROGRESS_PATTERN.match(line):
+                print(f"  {line.rstrip()}")
+                if line.startswith("ERROR"):
+                    errors.append(line)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr="".join(errors))
+
+def _prepend_path(directory):
+    """Move directory to the front of PATH, dropping empty and duplicate entries"""
+    parts = [directory] + os.environ.get('PATH', '').split(os.pathsep)
+    os.environ['PATH'] = os.pathsep.join(dict.fromkeys(p for p in parts if p))
 
 def check_python_version():
     """Check the current Python version"""
@@ -27,89 +76,106 @@ def install_python312_if_needed():
     """Install Python 3.12 if it's not available"""
     print("=== Installing Python 3.12 ===")
     
-    # Check if Python 3.12 is already available
-    try:
-        result = subprocess.run(["python3.12", "--version"], 
-                              capture_output=True, text=True, check=True)
-        print(f"✓ Python 3.12 already installed: {result.stdout.strip()}")
+    # Check if Python 3.12 is already available (PATH scan, no interpreter launch)
+    python312_path = shutil.which("python3.12")
+    if python312_path:
+        print(f"✓ Python 3.12 already installed: {python312_path}")
         return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("Python 3.12 not found. Installing...")
+    print("Python 3.12 not found. Installing...")
     
     try:
         # Update package lists
         print("Updating package lists...")
-        subprocess.run(["sudo", "apt-get", "update"], 
-                      check=True, capture_output=True)
+        _run_quiet(["sudo", "apt-get", "update"])
         
-        # Install required packages
-        print("Installing required packages...")
-        subprocess.run(["sudo", "apt-get", "install", "-y", 
-                       "software-properties-common", "wget", "build-essential",
-                       "libssl-dev", "zlib1g-dev", "libbz2-dev",
-                       "libreadline-dev", "libsqlite3-dev", "curl",
-                       "libncursesw5-dev", "xz-utils", "tk-dev",
-                       "libxml2-dev", "libxmlsec1-dev", "libffi-dev",
-                       "liblzma-dev"], check=True, capture_output=True)
+        # Install add-apt-repository
+        print("Installing software-properties-common...")
+        _run_quiet(["sudo", "apt-get", "install", "-y", "software-properties-common"])
         
-        # Add deadsnakes PPA
+        # Add deadsnakes PPA (add-apt-repository refreshes the package lists itself)
         print("Adding deadsnakes PPA...")
-        subprocess.run(["sudo", "add-apt-repository", "-y", "ppa:deadsnakes/ppa"], 
-                      check=True, capture_output=True)
-        
-        # Update package lists again
-        print("Updating package lists again...")
-        subprocess.run(["sudo", "apt-get", "update"], 
-                      check=True, capture_output=True)
+        _run_quiet(["sudo", "add-apt-repository", "-y", "ppa:deadsnakes/ppa"])
         
-        # Install Python 3.12
-        print("Installing Python 3.12...")
-        subprocess.run(["sudo", "apt-get", "install", "-y",
-                       "python3.12", "python3.12-dev", "python3.12-venv",
-                       "python3.12-distutils"], check=True, capture_output=True)
+        # Install Python 3.12 and the build dependencies in a single transaction
+        print("Installing Python 3.12 and required packages...")
+        _run_quiet(["sudo", "apt-get", "install", "-y",
+                    "python3.12", "python3.12-dev", "python3.12-venv",
+                    "python3.12-distutils",
+                    "wget", "build-essential",
+                    "libssl-dev", "zlib1g-dev", "libbz2-dev",
+                    "libreadline-dev", "libsqlite3-dev", "curl",
+                    "libncursesw5-dev", "xz-utils", "tk-dev",
+                    "libxml2-dev", "libxmlsec1-dev", "libffi-dev",
+                    "liblzma-dev"])
         
         print("✓ Python 3.12 installed successfully!")
         return True
     except subprocess.CalledProcessError as e:
         print(f"✗ Error installing Python 3.12: {e}")
-        print(f"stderr: {e.stderr.decode() if hasattr(e, 'stderr') else 'No stderr'}")
+        print(f"stderr: {e.stderr}")
         return False
 
-def create_python312_venv(venv_path="~/venvs/py312"):
-    """Create a Python 3.12 virtual environment"""
+def _remove_trees(paths):
+    """Delete directory trees, ignoring errors (run on a background thread)"""
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+def create_python312_venv(venv_path=DEFAULT_VENV, force=False):
+    """
+    Create a Python 3.12 virtual environment
+
+    An existing environment is reused unless force is True, in which case it
+    is removed and created again.
+    """
     print("=== Creating Python 3.12 Virtual Environment ===")
     
     # Expand user path
     venv_path = os.path.expanduser(venv_path)
+    
+    # Reuse an environment left by a previous session
+    if not force and os.path.exists(os.path.join(venv_path, "bin", "python")):
+        print(f"✓ Reusing existing virtual environment at: {venv_path}")
+        return venv_path
+    
     print(f"Creating virtual environment at: {venv_path}")
     
+    # Trees moved aside by earlier runs; their background delete dies with the
+    # process, so it may not have finished
+    old_trees = glob.glob(glob.escape(venv_path) + ".old.*")
+    
     # Remove existing venv if it exists
     if os.path.exists(venv_path):
         print(f"Removing existing virtual environment at {venv_path}")
-        shutil.rmtree(venv_path)
+        # Move the old tree aside (one rename) and delete it in the background
+        # so creating the new environment does not wait on a large rmtree
+        old_venv_path = f"{venv_path}.old.{os.getpid()}"
+        os.rename(venv_path, old_venv_path)
+        old_trees.append(old_venv_path)
+    
+    if old_trees:
+        threading.Thread(target=_remove_trees, args=(old_trees,), daemon=True).start()
     
     try:
         # Create virtual environment using Python 3.12
         print("Creating virtual environment with Python 3.12...")
-        subprocess.run(["python3.12", "-m", "venv", venv_path], 
-                      check=True, capture_output=True)
+        if sys.version_info[:2] == (3, 12):
+            # Running 3.12 itself: build in-process instead of starting another interpreter
+            import venv
+            venv.EnvBuilder(with_pip=True).create(venv_path)
+        else:
+            _run_quiet(["python3.12", "-m", "venv", venv_path])
         
         print("✓ Virtual environment created successfully!")
-        
-        # Upgrade pip in the virtual environment
-        print("Upgrading pip in virtual environment...")
-        pip_path = os.path.join(venv_path, "bin", "pip")
-        subprocess.run([pip_path, "install", "--upgrade", "pip", "setuptools", "wheel"], 
-                      check=True, capture_output=True)
-        
-        print("✓ Pip upgraded successfully!")
         return venv_path
     except subprocess.CalledProcessError as e:
         print(f"✗ Error creating virtual environment: {e}")
-        print(f"stderr: {e.stderr.decode() if hasattr(e, 'stderr') else 'No stderr'}")
+        print(f"stderr: {e.stderr}")
         return None
 
-def switch_to_venv(venv_path="~/venvs/py312"):
+# site-packages directories already seen to exist by switch_to_venv
+_known_site_packages = set()
+
+def switch_to_venv(venv_path=DEFAULT_VENV):
     """Switch the current Python environment to the virtual environment"""
     print("=== Switching to Python 3.12 Virtual Environment ===")
     
@@ -126,16 +192,31 @@ def switch_to_venv(venv_path="~/venvs/py312"):
     
     # Update environment variables
     print("Updating environment variables...")
-    os.environ['PATH'] = venv_bin_path + ":" + os.environ.get('PATH', '')
+    _prepend_path(venv_bin_path)
     os.environ['VIRTUAL_ENV'] = venv_path
     
     # Update sys.path
     python_version = "3.12"
     site_packages_path = os.path.join(venv_path, "lib", f"python{python_version}", "site-packages")
+    venv_python = os.path.join(venv_bin_path, "python")
     
-    if os.path.exists(site_packages_path):
-        # Remove existing site-packages paths that might be from Python 3.6
-        sys.path = [p for p in sys.path if "python3.6" not in p and "python2.7" not in p]
+    if site_packages_path in _known_site_packages:
+        site_packages_exists = True
+        venv_python_exists = os.path.exists(venv_python)
+    else:
+        # Stat both paths concurrently (slow on NFS-backed CDSW home directories)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            site_packages_exists, venv_python_exists = executor.map(
+                os.path.exists, [site_packages_path, venv_python])
+        if site_packages_exists:
+            _known_site_packages.add(site_packages_path)
+    
+    if site_packages_exists:
+        # Remove existing site-packages paths that might be from Python 3.6,
+        # leaving sys.path untouched when there are none
+        stale = {p for p in sys.path if "python3.6" in p or "python2.7" in p}
+        if stale:
+            sys.path[:] = [p for p in sys.path if p not in stale]
         
         # Insert the venv site-packages at the beginning
         if site_packages_path not in sys.path:
@@ -145,15 +226,17 @@ def switch_to_venv(venv_path="~/venvs/py312"):
         print(f"⚠ Warning: Site-packages path not found: {site_packages_path}")
     
     # Update sys.executable
-    venv_python = os.path.join(venv_bin_path, "python")
-    if os.path.exists(venv_python):
+    if venv_python_exists:
         sys.executable = venv_python
         print(f"✓ Set sys.executable to: {venv_python}")
     
+    # The environment changed, so earlier verification results are stale
+    _verify_cache.clear()
+    
     print("✓ Environment switch completed!")
     return True
 
-def install_common_packages(venv_path="~/venvs/py312"):
+def install_common_packages(venv_path=DEFAULT_VENV):
     """Install common data science packages in the virtual environment"""
     print("=== Installing Common Packages ===")
     
@@ -173,23 +256,41 @@ def install_common_packages(venv_path="~/venvs/py312"):
     ]
     
     try:
-        print("Installing common data science packages...")
-        subprocess.run([pip_path, "install"] + packages, 
-                      check=True, capture_output=True)
+        # Only install what is missing from the environment
+        result = _run([pip_path, "list", "--format=freeze"])
+        installed = {line.split("==")[0].lower().replace("_", "-")
+                     for line in result.stdout.splitlines()}
+        packages = [p for p in packages if p not in installed]
+        if not packages:
+            print("✓ Common packages already installed")
+            return True
+        
+        # Upgrade the packaging tools in the same pip run so the resolver starts once
+        print(f"Installing common data science packages: {' '.join(packages)}")
+        _run_streaming([pip_path, "install", "--upgrade", "pip", "setuptools", "wheel"] + packages)
         print("✓ Common packages installed successfully!")
         return True
     except subprocess.CalledProcessError as e:
         print(f"✗ Error installing packages: {e}")
-        print(f"stderr: {e.stderr.decode() if hasattr(e, 'stderr') else 'No stderr'}")
+        print(f"stderr: {e.stderr}")
         return False
 
 def verify_python312_setup():
-    """Verify that Python 3.12 is properly set up"""
+    """Verify that Python 3.12 is properly set up (cached per sys.executable)"""
     print("=== Verifying Python 3.12 Setup ===")
     
+    key = sys.executable
+    if key in _verify_cache:
+        print(f"Python executable: {key} (cached)")
+        return _verify_cache[key]
+    _verify_cache[key] = result = _verify_python312_setup(key)
+    return result
+
+def _verify_python312_setup(executable):
+    """Run the checks behind verify_python312_setup"""
     # Check Python version
     print(f"Current Python version: {sys.version}")
-    print(f"Python executable: {sys.executable}")
+    print(f"Python executable: {executable}")
     
     # Check if we're in a virtual environment
     in_venv = hasattr(sys, 'real_prefix') or (hasattr(sys, 'base_prefix') and sys.base_prefix != sys.prefix)
@@ -202,24 +303,21 @@ def verify_python312_setup():
     print(f"VIRTUAL_ENV environment variable: {venv_env}")
     
     # Check PATH
-    path_entries = os.environ.get('PATH', '').split(':')
+    path_entries = os.environ.get('PATH', '').split(os.pathsep)
     venv_paths = [p for p in path_entries if 'venv' in p or 'py312' in p]
     print(f"Virtual environment paths in PATH: {venv_paths}")
     
-    # Try to import Python 3.12 specific modules
-    try:
-        import zoneinfo  # Available in Python 3.9+
+    # Check Python 3.12 specific modules
+    if importlib.util.find_spec("zoneinfo") is not None:  # Python 3.9+
         print("✓ zoneinfo module available (Python 3.9+ feature)")
-    except ImportError:
+    else:
         print("✗ zoneinfo module not available (likely still using Python 3.6)")
         return False
     
-    # Try to import other Python 3.12 features
-    try:
-        # Test a feature that was improved in Python 3.12
-        import fcntl
+    # Check other Python 3.12 features
+    if importlib.util.find_spec("fcntl") is not None:
         print("✓ fcntl module available")
-    except ImportError:
+    else:
         print("✗ fcntl module not available")
         return False
     
@@ -232,12 +330,12 @@ def verify_python312_setup():
         print(f"✗ Python version is less than 3.12 ({version_info.major}.{version_info.minor})")
         return False
 
-def create_activation_script(venv_path="~/venvs/py312"):
+def create_activation_script(venv_path=DEFAULT_VENV):
     """Create a script to easily activate the Python 3.12 environment"""
     print("=== Creating Activation Script ===")
     
     venv_path = os.path.expanduser(venv_path)
-    activation_script_path = os.path.expanduser("~/activate_py312.sh")
+    activation_script_path = ACTIVATION_SCRIPT_PATH
     
     activation_script = f"""#!/bin/bash
 # Script to activate Python 3.12 virtual environment in CDSW
@@ -268,30 +366,42 @@ python --version
         print(f"✗ Error creating activation script: {e}")
         return None
 
-def force_python312_execution(command, venv_path="~/venvs/py312"):
-    """Force execution of a command using Python 3.12 virtual environment"""
+def force_python312_execution(command, venv_path=DEFAULT_VENV):
+    """
+    Force execution of a command using Python 3.12 virtual environment
+
+    The command is split with shlex and executed directly rather than through
+    /bin/sh, so shell features such as pipes, redirection and variable
+    expansion are not interpreted.
+    """
     print(f"=== Executing Command with Python 3.12 ===")
     print(f"Command: {command}")
     
     venv_path = os.path.expanduser(venv_path)
     venv_bin_path = os.path.join(venv_path, "bin")
     
+    try:
+        argv = shlex.split(command)
+    except ValueError as e:
+        print(f"✗ Error executing command: {e}")
+        return None
+    if not argv:
+        print("✗ Error executing command: empty command")
+        return None
+    
     # Modify the command to use the virtual environment
-    if command.startswith("python "):
-        command = command.replace("python ", f"{venv_bin_path}/python ", 1)
-    elif command.startswith("pip "):
-        command = command.replace("pip ", f"{venv_bin_path}/pip ", 1)
-    elif command == "python" or command == "python3":
-        command = f"{venv_bin_path}/python"
+    if argv[0] in ("python", "python3"):
+        argv[0] = os.path.join(venv_bin_path, "python")
+    elif argv[0] == "pip":
+        argv[0] = os.path.join(venv_bin_path, "pip")
     
     # Set environment variables for the subprocess
     env = os.environ.copy()
-    env['PATH'] = venv_bin_path + ":" + env.get('PATH', '')
+    env['PATH'] = venv_bin_path + os.pathsep + env.get('PATH', '')
     env['VIRTUAL_ENV'] = venv_path
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, 
-                              text=True, env=env, check=True)
+        result = _run(argv, env=env)
         print("✓ Command executed successfully!")
         print("Output:")
         print(result.stdout)
@@ -303,22 +413,46 @@ def force_python312_execution(command, venv_path="~/venvs/py312"):
         print(f"✗ Error executing command: {e}")
         print(f"Stderr: {e.stderr}")
         return None
+    except FileNotFoundError as e:
+        print(f"✗ Error executing command: {e}")
+        return None
 
-def main():
-    """Main function to orchestrate the Python 3.12 setup"""
+def _venv_active(venv_path=DEFAULT_VENV):
+    """True if venv_path holds an environment and this session is running in it"""
+    if not os.path.exists(os.path.join(venv_path, "bin", "python")):
+        return False
+    venv_real = os.path.realpath(venv_path)
+    venv_env = os.environ.get('VIRTUAL_ENV')
+    return ((bool(venv_env) and os.path.realpath(venv_env) == venv_real)
+            or os.path.realpath(sys.prefix) == venv_real)
+
+def main(force=False):
+    """
+    Main function to orchestrate the Python 3.12 setup
+
+    Stages whose results already exist are skipped; pass force=True (or
+    --force on the command line) to rebuild the virtual environment.
+    """
     print("CDSW Python 3.12 Complete Installation and Switching Script")
     print("=" * 60)
     
     # 1. Check current Python version
     current_version = check_python_version()
     
+    # Nothing to do if this session already runs in the environment; otherwise
+    # each stage below skips whatever already exists
+    if not force and _venv_active():
+        print("\n" + "=" * 60)
+        print("✓ Python 3.12 is already active. Nothing to do.")
+        return True
+    
     # 2. Install Python 3.12 if needed
     if not install_python312_if_needed():
         print("✗ Failed to install Python 3.12. Exiting.")
         return False
     
     # 3. Create Python 3.12 virtual environment
-    venv_path = create_python312_venv()
+    venv_path = create_python312_venv(force=force)
     if not venv_path:
         print("✗ Failed to create Python 3.12 virtual environment. Exiting.")
         return False
@@ -361,5 +495,5 @@ def main():
         return False
 
 if __name__ == "__main__":
-    success = main()
+    success = main(force="--force" in sys.argv[1:])
     sys.exit(0 if success else 1)
@@ -12,205 +12,356 @@ Author: AI Assistant
 Date: 2025
 """
 
+import importlib.util
 import os
+import re
 import sys
-import subprocess
-from pathlib import Path
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-def find_python_installations():
-    """Find all Python installations in the system"""
+# Resolved once at import time
+HOME = os.path.expanduser("~")
+
+# The interpreter actually running this module; sys.executable is repointed
+# at python3.12 by the switch methods, so it cannot be used for this later
+_RUNNING_PYTHON = os.path.realpath(sys.executable)
+
+# Remembers the resolved python3.12 path across process restarts
+PYTHON312_CACHE = os.path.join(HOME, ".cache", "cdsw_py312_path")
+
+# Templates written by create_persistent_switch_script / create_python312_alias,
+# kept as bytes so they are written and compared without re-encoding
+_SWITCH_SH = b"""#!/bin/bash
+# CDSW Python 3.12 Switch Script
+# Source this script to switch to Python 3.12: source ~/switch_to_python312.sh
+
+# Find python3.12
+PYTHON312_PATH=$(command -v python3.12)
+
+if [ -z "$PYTHON312_PATH" ]; then
+    echo "Error: python3.12 not found in PATH"
+    return 1
+fi
+
+# Get the directory containing python3.12
+PYTHON312_DIR=$(dirname "$PYTHON312_PATH")
+
+# Update PATH to prioritize Python 3.12 (skipped if it is already there)
+case ":$PATH:" in
+    *":$PYTHON312_DIR:"*) ;;
+    *) export PATH="$PYTHON312_DIR:$PATH" ;;
+esac
+
+# Set Python version environment variables
+export PY_PYTHON=3.12
+export PYTHON_VERSION=3.12
+
+# Verify the switch
+echo "Switched to Python 3.12"
+echo "Python executable: $(which python3)"
+echo "Python version: $(python3 --version 2>&1)"
+"""
+
+_ALIAS_BASHRC = b"""
+# Python 3.12 aliases
+alias python312='python3.12'
+alias pip312='python3.12 -m pip'
+alias python='/usr/bin/python3.12'
+"""
+
+# verify_current_python results, keyed by sys.executable
+_verify_cache = {}
+
+# Executables resolved so far. Only hits are stored, so something installed
+# after a failed lookup is found on the next call.
+_found_paths = {}
+
+def _which(name):
+    """Resolve an executable on PATH once per process, without spawning `which`"""
+    if name not in _found_paths:
+        path = shutil.which(name)
+        if path is None:
+            return None
+        _found_paths[name] = path
+    return _found_paths[name]
+
+def _require(name):
+    """Return the cached path of an executable, raising FileNotFoundError if missing"""
+    path = _which(name)
+    if path is None:
+        raise FileNotFoundError(f"{name} not found in PATH")
+    return path
+
+def _find_python312():
+    """
+    Return the python3.12 path, or None
+
+    The result is persisted to PYTHON312_CACHE so later runs (CDSW sessions
+    restart often) can skip the PATH scan. A stale entry is removed.
+    """
+    try:
+        with open(PYTHON312_CACHE) as f:
+            cached_path = f.read().strip()
+        if cached_path and os.access(cached_path, os.X_OK):
+            return cached_path
+        os.unlink(PYTHON312_CACHE)
+    except OSError:
+        pass
+    
+    python312_path = _which("python3.12")
+    if python312_path:
+        try:
+            os.makedirs(os.path.dirname(PYTHON312_CACHE), exist_ok=True)
+            with open(PYTHON312_CACHE, 'w') as f:
+                f.write(python312_path)
+        except OSError:
+            pass  # The cache is only an optimisation
+    return python312_path
+
+def _require_python312():
+    """Return the python3.12 path, raising FileNotFoundError if missing"""
+    python312_path = _find_python312()
+    if python312_path is None:
+        raise FileNotFoundError("python3.12 not found in PATH")
+    return python312_path
+
+def _prepend_path(directory):
+    """Move directory to the front of PATH, dropping empty and duplicate entries"""
+    parts = [directory] + os.environ.get('PATH', '').split(os.pathsep)
+    os.environ['PATH'] = os.pathsep.join(dict.fromkeys(p for p in parts if p))
+
+def _write_if_changed(path, content, mode=0o644):
+    """Write bytes to path unless it already holds exactly that; return True if written"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    _atomic_write(path, content, mode)
+    return True
+
+def _atomic_write(path, data, mode):
+    """
+    Create path with the given mode in one open() and publish it with os.replace
+
+    The data goes out through unbuffered os.write calls on a per-process temp
+    file, which is removed if anything fails. No fsync is issued and O_SYNC is
+    not used: the file is regenerated from a constant template on every run,
+    so durability is not worth a synchronous NFS round-trip.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _python_version(location):
+    """Return the `--version` string of the interpreter at location"""
+    # The running interpreter can answer for itself without a subprocess
+    if os.path.realpath(location) == _RUNNING_PYTHON:
+        return f"Python {sys.version.split()[0]}"
+    # Imported here: most runs never spawn a probe
+    import subprocess
+    result = subprocess.run([location, "--version"], stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, text=True, check=True)
+    return result.stdout.strip()
+
+def find_python_installations(probe_versions=False):
+    """
+    Find all Python installations in the system
+
+    PATH is scanned once with os.scandir and every python3 / python3.X
+    executable is recorded, first match on PATH winning. Version strings are
+    derived from the file name, except for the running interpreter (which
+    reports its own) and a plain python3 (which is asked, as its name has no
+    minor version); pass probe_versions=True to ask every interpreter for its
+    exact `--version` instead.
+    """
     print("=== Finding Python Installations ===")
     
-    # Common locations for Python installations
-    common_paths = [
-        "/usr/bin",
-        "/usr/local/bin",
-        "/opt/python",
-        "/opt/anaconda3/bin",
-        "/home/cdsw/.local/bin",
-        "/usr/bin/python3*",
-        "/usr/local/bin/python3*"
-    ]
+    name_pattern = re.compile(r"^python3(\.\d+)?$")
+    found = {}
     
-    python_versions = {}
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        try:
+            entries = list(os.scandir(directory or "."))
+        except OSError:
+            continue
+        for entry in entries:
+            if (name_pattern.match(entry.name) and entry.name not in found
+                    and entry.is_file() and os.access(entry.path, os.X_OK)):
+                found[entry.name] = entry.path
     
-    # Check for python3.6 and python3.12 specifically
-    for version in ["3.6", "3.12"]:
+    def _probe(item):
+        name, location = item
+        import subprocess
         try:
-            # Try direct command
-            result = subprocess.run([f"python{version}", "--version"], 
-                                  capture_output=True, text=True, check=True)
-            python_versions[version] = {
-                "command": f"python{version}",
-                "version": result.stdout.strip(),
-                "location": subprocess.run(["which", f"python{version}"], 
-                                         capture_output=True, text=True, check=True).stdout.strip()
-            }
-            print(f"✓ Found Python {version}: {python_versions[version]['location']}")
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            print(f"⚠ Python {version} not found in PATH")
+            return name, location, _python_version(location)
+        except (subprocess.CalledProcessError, OSError):
+            return name, location, None
     
-    # Also check general python3
-    try:
-        result = subprocess.run(["python3", "--version"], 
-                              capture_output=True, text=True, check=True)
-        python_versions["default"] = {
-            "command": "python3",
-            "version": result.stdout.strip(),
-            "location": subprocess.run(["which", "python3"], 
-                                     capture_output=True, text=True, check=True).stdout.strip()
+    def _from_name(item):
+        name, location = item
+        if os.path.realpath(location) == _RUNNING_PYTHON:
+            return name, location, f"Python {sys.version.split()[0]}"
+        if name == "python3":
+            return _probe(item)
+        return name, location, f"Python {name[len('python'):]}"
+    
+    if probe_versions:
+        # --version probes are independent subprocesses; run them concurrently
+        # (waiting on a child releases the GIL)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(_probe, sorted(found.items())))
+    else:
+        results = [_from_name(item) for item in sorted(found.items())]
+    
+    python_versions = {}
+    for name, location, version in results:
+        if version is None:
+            print(f"⚠ {location} did not report a version")
+            continue
+        key = name[len("python"):] if name != "python3" else "default"
+        python_versions[key] = {
+            "command": name,
+            "version": version,
+            "location": location
         }
-        print(f"✓ Found default python3: {python_versions['default']['location']}")
-    except (subprocess.CalledProcessError, FileNotFoundError):
+        print(f"✓ Found {name}: {location}")
+    
+    # Report the versions this script cares about when they are missing
+    for version in ["3.6", "3.12"]:
+        if version not in python_versions:
+            print(f"⚠ Python {version} not found in PATH")
+    if "default" not in python_versions:
         print("⚠ Default python3 not found in PATH")
     
     return python_versions
 
-def switch_to_python312_method1():
-    """Method 1: Direct PATH manipulation"""
-    print("=== Switching to Python 3.12 (Method 1: PATH Manipulation) ===")
-    
-    # First, find where python3.12 is located
+def _switch(do_symlink=False, do_env_vars=False, installs=None):
+    """
+    Shared implementation of the switching methods
+
+    python3.12 is taken from installs (the find_python_installations result)
+    when given, otherwise resolved through the cached lookup. Its directory
+    (or a ~/local/bin python3 symlink to it when do_symlink is set) is moved
+    to the front of PATH, and sys.executable is updated. do_env_vars also
+    sets PY_PYTHON and PYTHON_VERSION.
+    """
+    # sys.executable is about to change, so earlier verifications are stale
+    _verify_cache.clear()
     try:
-        result = subprocess.run(["which", "python3.12"], 
-                              capture_output=True, text=True, check=True)
-        python312_path = result.stdout.strip()
+        if installs is None:
+            python312_path = _require_python312()
+        elif "3.12" in installs:
+            python312_path = installs["3.12"]["location"]
+        else:
+            raise FileNotFoundError("python3.12 not among the discovered installations")
         print(f"Found python3.12 at: {python312_path}")
         
-        # Get the directory containing python3.12
-        python312_dir = os.path.dirname(python312_path)
-        print(f"Python 3.12 directory: {python312_dir}")
-        
-        # Update PATH to prioritize this directory
-        current_path = os.environ.get('PATH', '')
-        new_path = python312_dir + ":" + current_path
-        os.environ['PATH'] = new_path
-        
-        print("✓ Updated PATH to prioritize Python 3.12")
-        print(f"New PATH: {os.environ['PATH'][:100]}...")  # Show first 100 chars
-        
-        # Update sys.executable
-        sys.executable = python312_path
-        print(f"✓ Set sys.executable to: {sys.executable}")
-        
-        # Verify the switch
-        verify_current_python()
-        return True
-        
-    except subprocess.CalledProcessError:
-        print("✗ Could not find python3.12 executable")
+        if do_symlink:
+            # Check if we can use update-alternatives
+            if _which("update-alternatives"):
+                print("update-alternatives is available")
+                # This would require sudo, which might not be available in CDSW
+                print("Note: This method typically requires sudo privileges")
+            else:
+                print("update-alternatives not available")
+            
+            print(f"Current python3: {_require('python3')}")
+            print(f"Target python3.12: {python312_path}")
+            
+            # For CDSW, we'll create a local symlink in a user-writable directory
+            bin_dir = os.path.join(HOME, "local", "bin")
+            os.makedirs(bin_dir, exist_ok=True)
+            
+            # Create symlink for python3 pointing to python3.12, under a temporary
+            # name first so replacing an existing link is a single atomic rename
+            executable = os.path.join(bin_dir, "python3")
+            tmp_link = f"{executable}.{os.getpid()}.tmp"
+            os.symlink(python312_path, tmp_link)
+            try:
+                os.replace(tmp_link, executable)
+            except OSError:
+                os.unlink(tmp_link)
+                raise
+            print(f"✓ Created symlink: {executable} -> {python312_path}")
+        else:
+            # Get the directory containing python3.12
+            bin_dir = os.path.dirname(python312_path)
+            executable = python312_path
+            print(f"Python 3.12 directory: {bin_dir}")
+    except FileNotFoundError as e:
+        print(f"✗ Could not find python3.12 executable: {e}")
         return False
+    
+    if do_env_vars:
+        os.environ.update(PY_PYTHON='3.12', PYTHON_VERSION='3.12')
+        print("✓ Set PY_PYTHON=3.12")
+        print("✓ Set PYTHON_VERSION=3.12")
+    
+    # Update PATH to prioritize this directory
+    _prepend_path(bin_dir)
+    print("✓ Updated PATH to prioritize Python 3.12")
+    print(f"New PATH: {os.environ['PATH'][:100]}...")  # Show first 100 chars
+    
+    # Update sys.executable
+    sys.executable = executable
+    print(f"✓ Set sys.executable to: {sys.executable}")
+    
+    # Verify the switch
+    verify_current_python()
+    return True
 
-def switch_to_python312_method2():
+def switch_to_python312_method1(installs=None):
+    """Method 1: Direct PATH manipulation"""
+    print("=== Switching to Python 3.12 (Method 1: PATH Manipulation) ===")
+    return _switch(installs=installs)
+
+def switch_to_python312_method2(installs=None):
     """Method 2: Using update-alternatives or direct symlink manipulation"""
     print("=== Switching to Python 3.12 (Method 2: Symlink Manipulation) ===")
-    
-    try:
-        # Check if we can use update-alternatives
-        result = subprocess.run(["which", "update-alternatives"], 
-                              capture_output=True, text=True)
-        if result.returncode == 0:
-            print("update-alternatives is available")
-            # This would require sudo, which might not be available in CDSW
-            print("Note: This method typically requires sudo privileges")
-        else:
-            print("update-alternatives not available")
-        
-        # Find python3.12 location
-        result = subprocess.run(["which", "python3.12"], 
-                              capture_output=True, text=True, check=True)
-        python312_path = result.stdout.strip()
-        
-        # Find python3 location
-        result = subprocess.run(["which", "python3"], 
-                              capture_output=True, text=True, check=True)
-        python3_path = result.stdout.strip()
-        
-        print(f"Current python3: {python3_path}")
-        print(f"Target python3.12: {python312_path}")
-        
-        # For CDSW, we'll create a local symlink in a user-writable directory
-        local_bin = os.path.expanduser("~/local/bin")
-        os.makedirs(local_bin, exist_ok=True)
-        
-        # Create symlink for python3 pointing to python3.12
-        local_python3 = os.path.join(local_bin, "python3")
-        if os.path.exists(local_python3):
-            os.remove(local_python3)
-        
-        os.symlink(python312_path, local_python3)
-        print(f"✓ Created symlink: {local_python3} -> {python312_path}")
-        
-        # Update PATH to prioritize our local bin
-        current_path = os.environ.get('PATH', '')
-        new_path = local_bin + ":" + current_path
-        os.environ['PATH'] = new_path
-        
-        print("✓ Updated PATH to prioritize local Python 3.12")
-        print(f"New PATH: {os.environ['PATH'][:100]}...")  # Show first 100 chars
-        
-        # Update sys.executable
-        sys.executable = local_python3
-        print(f"✓ Set sys.executable to: {sys.executable}")
-        
-        # Verify the switch
-        verify_current_python()
-        return True
-        
-    except subprocess.CalledProcessError as e:
-        print(f"✗ Error in method 2: {e}")
-        return False
+    return _switch(do_symlink=True, installs=installs)
 
-def switch_to_python312_method3():
+def switch_to_python312_method3(installs=None):
     """Method 3: Environment variable approach"""
     print("=== Switching to Python 3.12 (Method 3: Environment Variables) ===")
-    
-    try:
-        # Find python3.12 location
-        result = subprocess.run(["which", "python3.12"], 
-                              capture_output=True, text=True, check=True)
-        python312_path = result.stdout.strip()
-        python312_dir = os.path.dirname(python312_path)
-        
-        # Set environment variables
-        os.environ['PY_PYTHON'] = '3.12'
-        os.environ['PYTHON_VERSION'] = '3.12'
-        
-        # Update PATH
-        current_path = os.environ.get('PATH', '')
-        new_path = python312_dir + ":" + current_path
-        os.environ['PATH'] = new_path
-        
-        # Update sys.executable
-        sys.executable = python312_path
-        
-        print(f"✓ Set PY_PYTHON=3.12")
-        print(f"✓ Set PYTHON_VERSION=3.12")
-        print(f"✓ Updated PATH and sys.executable to Python 3.12")
-        
-        # Verify the switch
-        verify_current_python()
-        return True
-        
-    except subprocess.CalledProcessError as e:
-        print(f"✗ Error finding python3.12: {e}")
-        return False
+    return _switch(do_env_vars=True, installs=installs)
 
 def verify_current_python():
-    """Verify which Python version is currently active"""
+    """Verify which Python version is currently active (cached per sys.executable)"""
     print("=== Verifying Current Python Version ===")
     
+    key = sys.executable
+    if key in _verify_cache:
+        print(f"Python executable: {key} (cached)")
+        return _verify_cache[key]
+    _verify_cache[key] = result = _verify_current_python()
+    return result
+
+def _verify_current_python():
+    """Run the checks behind verify_current_python"""
     print(f"Python executable: {sys.executable}")
     print(f"Python version: {sys.version}")
     
-    # Check if we can import Python 3.12 specific modules
-    try:
-        import zoneinfo  # Available in Python 3.9+
+    # Check if Python 3.12 specific modules are available (without importing them)
+    zoneinfo_available = importlib.util.find_spec("zoneinfo") is not None  # Python 3.9+
+    if zoneinfo_available:
         print("✓ zoneinfo module available (Python 3.9+ feature)")
-        zoneinfo_available = True
-    except ImportError:
+    else:
         print("✗ zoneinfo module not available (likely Python 3.6 or older)")
-        zoneinfo_available = False
     
     # Check version directly
     version_info = sys.version_info
@@ -230,44 +381,14 @@ def create_persistent_switch_script():
     """Create a script that can be sourced to persistently switch Python versions"""
     print("=== Creating Persistent Switch Script ===")
     
-    script_content = """#!/bin/bash
-# CDSW Python 3.12 Switch Script
-# Source this script to switch to Python 3.12: source ~/switch_to_python312.sh
-
-# Find python3.12
-PYTHON312_PATH=$(which python3.12 2>/dev/null)
-
-if [ -z "$PYTHON312_PATH" ]; then
-    echo "Error: python3.12 not found in PATH"
-    return 1
-fi
-
-# Get the directory containing python3.12
-PYTHON312_DIR=$(dirname "$PYTHON312_PATH")
-
-# Update PATH to prioritize Python 3.12
-export PATH="$PYTHON312_DIR:$PATH"
-
-# Set Python version environment variables
-export PY_PYTHON=3.12
-export PYTHON_VERSION=3.12
-
-# Verify the switch
-echo "Switched to Python 3.12"
-echo "Python executable: $(which python3)"
-echo "Python version: $(python3 --version 2>&1)"
-"""
-
-    script_path = os.path.expanduser("~/switch_to_python312.sh")
+    script_path = os.path.join(HOME, "switch_to_python312.sh")
     
     try:
-        with open(script_path, 'w') as f:
-            f.write(script_content)
-        
-        # Make it executable
-        os.chmod(script_path, 0o755)
-        
-        print(f"✓ Created switch script at: {script_path}")
+        # Write it executable, leaving an identical existing file untouched
+        if _write_if_changed(script_path, _SWITCH_SH, 0o755):
+            print(f"✓ Created switch script at: {script_path}")
+        else:
+            print(f"✓ Switch script already up to date: {script_path}")
         print("To use it, run: source ~/switch_to_python312.sh")
         return script_path
     except Exception as e:
@@ -278,20 +399,13 @@ def create_python312_alias():
     """Create aliases for Python 3.12"""
     print("=== Creating Python 3.12 Aliases ===")
     
-    bashrc_content = """
-# Python 3.12 aliases
-alias python312='python3.12'
-alias pip312='python3.12 -m pip'
-alias python='/usr/bin/python3.12'
-"""
-
-    bashrc_path = os.path.expanduser("~/.bashrc_cdsw_python312")
+    bashrc_path = os.path.join(HOME, ".bashrc_cdsw_python312")
     
     try:
-        with open(bashrc_path, 'w') as f:
-            f.write(bashrc_content)
-        
-        print(f"✓ Created alias file at: {bashrc_path}")
+        if _write_if_changed(bashrc_path, _ALIAS_BASHRC):
+            print(f"✓ Created alias file at: {bashrc_path}")
+        else:
+            print(f"✓ Alias file already up to date: {bashrc_path}")
         print("To use it, run: source ~/.bashrc_cdsw_python312")
         return bashrc_path
     except Exception as e:
@@ -305,27 +419,45 @@ def main():
     print("This script helps you switch to Python 3.12 in CDSW")
     print()
     
+    # Nothing to switch if this interpreter is already 3.12+
+    if sys.version_info >= (3, 12):
+        print(f"✓ Already on Python {sys.version.split()[0]}")
+        create_persistent_switch_script()
+        create_python312_alias()
+        return
+    
     # 1. Find Python installations
     python_installs = find_python_installations()
+    
+    # Take python3.12 from the persisted lookup (PYTHON312_CACHE), which also
+    # records it for the next session
+    python312_path = _find_python312()
+    if python312_path:
+        python_installs.setdefault("3.12", {
+            "command": "python3.12",
+            "version": "Python 3.12",
+        })["location"] = python312_path
     print()
     
     # 2. Try different switching methods
     print("Attempting to switch to Python 3.12...")
     print()
     
-    # Try Method 1 first (most likely to work in CDSW)
-    if switch_to_python312_method1():
-        print("\n✓ Successfully switched to Python 3.12 using Method 1!")
+    # Try Method 1 first (most likely to work in CDSW). The methods all take
+    # python3.12 from python_installs, so a fallback does not resolve it again.
+    methods = [
+        ("Method 1", switch_to_python312_method1),
+        ("Method 2", switch_to_python312_method2),
+        ("Method 3", switch_to_python312_method3),
+    ]
+    for index, (name, method) in enumerate(methods):
+        if method(installs=python_installs):
+            print(f"\n✓ Successfully switched to Python 3.12 using {name}!")
+            break
+        if index + 1 < len(methods):
+            print(f"\n⚠ {name} failed, trying {methods[index + 1][0]}...")
     else:
-        print("\n⚠ Method 1 failed, trying Method 2...")
-        if switch_to_python312_method2():
-            print("\n✓ Successfully switched to Python 3.12 using Method 2!")
-        else:
-            print("\n⚠ Method 2 failed, trying Method 3...")
-            if switch_to_python312_method3():
-                print("\n✓ Successfully switched to Python 3.12 using Method 3!")
-            else:
-                print("\n✗ All switching methods failed!")
+        print("\n✗ All switching methods failed!")
     
     print("\n" + "=" * 40)
     
@@ -10,6 +10,34 @@ Author: AI Assistant
 Date: 2025
 """
 
+import glob
+import os
+
+# Resolved once at import time
+HOME = os.path.expanduser("~")
+VENV_PATH = os.path.join(HOME, "venvs", "py312")
+VENV_BIN = os.path.join(VENV_PATH, "bin")
+
+# sys.path entries left over from the Python 3.6 engine
+_STALE_PATH_MARKER = "python3.6"
+
+# venv path -> site-packages directory, filled in once found
+_site_packages_cache = {}
+
+def _find_site_packages(venv_path):
+    """Return the venv's lib/python3.*/site-packages directory, or None"""
+    if venv_path not in _site_packages_cache:
+        matches = glob.glob(os.path.join(venv_path, "lib", "python3.*", "site-packages"))
+        if not matches:
+            return None
+        _site_packages_cache[venv_path] = sorted(matches)[-1]
+    return _site_packages_cache[venv_path]
+
+def _prepend_path(directory):
+    """Move directory to the front of PATH, dropping empty and duplicate entries"""
+    parts = [directory] + os.environ.get('PATH', '').split(os.pathsep)
+    os.environ['PATH'] = os.pathsep.join(dict.fromkeys(p for p in parts if p))
+
 def switch_to_python312_venv():
     """
     Method 1: Programmatically switch to Python 3.12 virtual environment
@@ -20,8 +48,8 @@ def switch_to_python312_venv():
     import os
     
     # Define the path to your Python 3.12 virtual environment
-    # Adjust this path to match your actual venv location
-    venv_path = os.path.expanduser("~/venvs/py312")
+    # Adjust VENV_PATH to match your actual venv location
+    venv_path = VENV_PATH
     
     print(f"Attempting to switch to virtual environment at: {venv_path}")
     
@@ -32,26 +60,26 @@ def switch_to_python312_venv():
         return
     
     # Update the PATH to use the virtual environment's Python
-    venv_bin_path = os.path.join(venv_path, "bin")
-    os.environ['PATH'] = venv_bin_path + ":" + os.environ.get('PATH', '')
+    venv_bin_path = VENV_BIN
+    _prepend_path(venv_bin_path)
     
     # Set VIRTUAL_ENV environment variable
     os.environ['VIRTUAL_ENV'] = venv_path
     
     # Update sys.path to include the virtual environment's site-packages
-    python_version = "3.12"  # Adjust if needed
-    site_packages_path = os.path.join(venv_path, "lib", f"python{python_version}", "site-packages")
+    site_packages_path = _find_site_packages(venv_path)
     
-    if os.path.exists(site_packages_path):
-        # Remove existing site-packages paths that might be from Python 3.6
-        sys.path = [p for p in sys.path if "python3.6" not in p]
+    if site_packages_path:
+        # Remove existing site-packages paths that might be from Python 3.6,
+        # in place so references to sys.path stay valid
+        sys.path[:] = [p for p in sys.path if _STALE_PATH_MARKER not in p]
         
         # Insert the venv site-packages at the beginning
         if site_packages_path not in sys.path:
             sys.path.insert(0, site_packages_path)
             print(f"Added {site_packages_path} to sys.path")
     else:
-        print(f"Warning: Site-packages path not found: {site_packages_path}")
+        print(f"Warning: Site-packages path not found under: {os.path.join(venv_path, 'lib')}")
     
     # Update sys.executable to point to the venv Python
     venv_python = os.path.join(venv_bin_path, "python")
@@ -77,12 +105,12 @@ def create_python312_venv():
     import subprocess
     
     # Define paths
-    venv_path = os.path.expanduser("~/venvs/py312")
+    venv_path = VENV_PATH
     
     # Check if Python 3.12 is available
     try:
-        result = subprocess.run(["python3.12", "--version"], 
-                              capture_output=True, text=True, check=True)
+        result = subprocess.run(["python3.12", "--version"], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True, check=True)
         print(f"Found Python 3.12: {result.stdout.strip()}")
     except (subprocess.CalledProcessError, FileNotFoundError):
         print("Python 3.12 not found. Installing...")
@@ -113,24 +141,15 @@ def install_python312():
     import subprocess
     
     try:
-        # Update package lists
-        subprocess.run(["sudo", "apt-get", "update"], check=True)
-        
-        # Install required packages
-        subprocess.run(["sudo", "apt-get", "install", "-y", 
-                       "software-properties-common"], check=True)
-        
-        # Add deadsnakes PPA
-        subprocess.run(["sudo", "add-apt-repository", "-y", "ppa:deadsnakes/ppa"], 
-                      check=True)
-        
-        # Update package lists again
-        subprocess.run(["sudo", "apt-get", "update"], check=True)
-        
-        # Install Python 3.12
-        subprocess.run(["sudo", "apt-get", "install", "-y",
-                       "python3.12", "python3.12-dev", "python3.12-venv"], 
-                      check=True)
+        # Run every apt step in one sudo shell so sudo authenticates once and
+        # apt's state stays warm between steps
+        subprocess.run(["sudo", "bash", "-euxc",
+                        "apt-get update"
+                        " && apt-get install -y software-properties-common"
+                        " && add-apt-repository -y ppa:deadsnakes/ppa"
+                        " && apt-get update"
+                        " && apt-get install -y python3.12 python3.12-dev python3.12-venv"],
+                       check=True)
         
         print("Python 3.12 installed successfully!")
         return True
@@ -142,31 +161,49 @@ def execute_in_venv(command):
     """
     Method 4: Execute a command using the Python 3.12 virtual environment
     
+    The command is split with shlex and run directly, without /bin/sh, so
+    shell syntax such as pipes or redirection is not interpreted.
+    
     Usage:
     execute_in_venv("pip install pandas")
     execute_in_venv("python -c 'import sys; print(sys.version)'")
     """
+    import shlex
+    import shutil
     import subprocess
     import os
     
-    venv_path = os.path.expanduser("~/venvs/py312")
-    venv_bin_path = os.path.join(venv_path, "bin")
+    venv_path = VENV_PATH
+    venv_bin_path = VENV_BIN
+    
+    try:
+        argv = shlex.split(command)
+    except ValueError as e:
+        print(f"Error executing command: {e}")
+        return None
+    if not argv:
+        print("Error executing command: empty command")
+        return None
     
     # Modify the command to use the virtual environment
-    if command.startswith("python"):
-        command = command.replace("python", os.path.join(venv_bin_path, "python"), 1)
-    elif command.startswith("pip"):
-        command = command.replace("pip", os.path.join(venv_bin_path, "pip"), 1)
+    if argv[0].startswith(("python", "pip")):
+        argv[0] = os.path.join(venv_bin_path, argv[0])
     
     # Set environment variables for the subprocess
     env = os.environ.copy()
-    env['PATH'] = venv_bin_path + ":" + env.get('PATH', '')
+    env['PATH'] = venv_bin_path + os.pathsep + env.get('PATH', '')
     env['VIRTUAL_ENV'] = venv_path
     
-    print(f"Executing in venv: {command}")
+    print(f"Executing in venv: {' '.join(argv)}")
+    
+    # Resolve the program once against the venv-first PATH
+    executable = shutil.which(argv[0], path=env['PATH'])
+    if executable is None:
+        print(f"Error executing command: {argv[0]} not found")
+        return None
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, 
+        result = subprocess.run(argv, executable=executable, capture_output=True, 
                               text=True, env=env, check=True)
         print("Output:")
         print(result.stdout)
@@ -188,8 +225,6 @@ def setup_ipython_magic():
     try:
         # This would typically be used in a Jupyter notebook
         from IPython.core.magic import register_line_magic
-        import os
-        import sys
         
         @register_line_magic
         def venv(line):
@@ -217,7 +252,6 @@ def verify_python312_setup():
     
     import sys
     import os
-    import subprocess
     
     # Check current Python version
     print(f"Current Python version: {sys.version}")
@@ -234,7 +268,7 @@ def verify_python312_setup():
     print(f"VIRTUAL_ENV environment variable: {venv_env}")
     
     # Check PATH
-    path_entries = os.environ.get('PATH', '').split(':')
+    path_entries = os.environ.get('PATH', '').split(os.pathsep)
     venv_paths = [p for p in path_entries if 'venv' in p or 'py312' in p]
     print(f"Virtual environment paths in PATH: {venv_paths}")
     
@@ -13,29 +13,327 @@ Usage in CDSW:
     !python3 fix_cdsw_python_version.py
 """
 
+import builtins
+import importlib.util
 import os
 import sys
-import subprocess
+import shutil
+from functools import lru_cache
+
+# Resolved once at import time
+HOME = os.path.expanduser("~")
+
+# Remembers the resolved python3.12 path across process restarts
+PYTHON312_CACHE = os.path.join(HOME, ".cache", "cdsw_py312_path")
+
+# Banner rules used by the report sections
+_BAR50 = "=" * 50
+_BAR30 = "=" * 30
+
+# Set while re-executing under python3.12 so a mislabelled interpreter cannot loop
+_REEXEC_ENV = "CDSW_PY312_REEXEC"
+
+# Source of the helper module written by create_helper_function, encoded once
+# (it contains non-ASCII characters, so it cannot be a bytes literal)
+_HELPER_PY = '''
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+# Fallback locations checked when python3.12 is not on PATH
+COMMON_PY312_LOCATIONS = [
+    "/usr/bin/python3.12",
+    "/usr/local/bin/python3.12",
+    "/opt/python3.12/bin/python3.12"
+]
+
+# Set by exec_into_python312 so a python3.12 that is not really 3.12 cannot loop
+_REEXEC_ENV = "CDSW_PY312_REEXEC"
+
+# python3.12 path once found. A miss is not stored, so installing python3.12
+# after a failed switch and calling again picks it up.
+_found_paths = {}
+
+def _find_python312():
+    """
+    Locate the python3.12 executable once per session.
+
+    Only a successful lookup is cached; after a miss the next call looks again.
+    """
+    if "python3.12" in _found_paths:
+        return _found_paths["python3.12"]
+    
+    # shutil.which walks PATH in-process, so no `which` subprocess is spawned
+    python312_path = shutil.which("python3.12")
+    if not python312_path:
+        # Stat the fallback locations concurrently; on NFS/FUSE-backed images each
+        # stat can take tens of milliseconds
+        def _executable(location):
+            if os.path.isfile(location) and os.access(location, os.X_OK):
+                return location
+            return None
+        
+        with ThreadPoolExecutor(max_workers=len(COMMON_PY312_LOCATIONS)) as executor:
+            hits = list(executor.map(_executable, COMMON_PY312_LOCATIONS))
+        python312_path = next((hit for hit in hits if hit), None)
+        if python312_path is None:
+            return None
+    
+    _found_paths["python3.12"] = python312_path
+    return python312_path
+
+def _prepend_path(directory):
+    """Move directory to the front of PATH, dropping empty and duplicate entries"""
+    parts = [directory] + os.environ.get('PATH', '').split(os.pathsep)
+    os.environ['PATH'] = os.pathsep.join(dict.fromkeys(p for p in parts if p))
+
+def _do_switch(verbose):
+    """
+    Shared body of switch_to_python312 (verbose=False) and
+    switch_to_python312_advanced (verbose=True, which reports every step)
+    """
+    import sys
+    
+    if verbose:
+        print("=== Switching to Python 3.12 ===")
+        print(f"Current Python version: {sys.version}")
+        print(f"Current executable: {sys.executable}")
+    
+    if sys.version_info[:2] >= (3, 12):
+        if verbose:
+            print("✅ Already running Python 3.12, nothing to switch")
+        return True
+    
+    try:
+        # Find Python 3.12 on PATH, then in common locations (cached after the first lookup)
+        python312_path = _find_python312()
+        if not python312_path:
+            if verbose:
+                print("❌ Could not find python3.12 executable")
+                print("Please check if Python 3.12 is installed:")
+                print("   ls -la /usr/bin/python3*")
+            else:
+                print("❌ Failed to find python3.12 on PATH or in common locations")
+            return False
+        if verbose:
+            print(f"Found python3.12: {python312_path}")
+        
+        # Update sys.executable
+        original_executable = sys.executable
+        sys.executable = python312_path
+        
+        # Update PATH
+        python312_dir = os.path.dirname(python312_path)
+        _prepend_path(python312_dir)
+        
+        # Set environment variables
+        os.environ.update(PY_PYTHON='3.12', PYTHON_VERSION='3.12')
+    except Exception as e:
+        print(f"❌ Failed to switch: {e}")
+        return False
+    
+    if not verbose:
+        print(f"✅ Switched to Python 3.12: {sys.executable}")
+        return True
+    
+    print(f"Updated sys.executable: {original_executable} → {sys.executable}")
+    print(f"Updated PATH to prioritize: {python312_dir}")
+    print("Set environment variables: PY_PYTHON=3.12, PYTHON_VERSION=3.12")
+    print(f"New Python version: {sys.version}")
+    
+    # Test Python 3.12 features
+    try:
+        import zoneinfo
+        print("✅ Python 3.12 features are available")
+        print("✅ Switch to Python 3.12 completed successfully!")
+        return True
+    except ImportError:
+        print("⚠ Python 3.12 features not available (may still be using old version)")
+        return True  # Still consider it a success since we updated the paths
+
+def switch_to_python312():
+    """
+    Switch to Python 3.12 in current CDSW session
+    Run this function at the start of your session
+    
+    This only updates sys.executable and environment variables, so child
+    processes use Python 3.12 while the running interpreter stays the same.
+    Use exec_into_python312() to actually restart under Python 3.12.
+    
+    Compatible with Python 3.6+
+    """
+    return _do_switch(False)
+
+def switch_to_python312_advanced():
+    """
+    Advanced version with more detailed error handling and fallbacks
+    """
+    return _do_switch(True)
+
+def exec_into_python312():
+    """
+    Replace the running process with Python 3.12, re-running the same script
+
+    On POSIX this uses os.execv, so the current interpreter image is replaced
+    in place and this function does not return. On Windows, where execv
+    spawns a new process anyway, the script is run in a child and this
+    process exits with its return code.
+
+    Returns True without restarting if already running Python 3.12, so it
+    is safe to call at the top of a script.
+    """
+    import subprocess
+    import sys
+    
+    if sys.version_info[:2] >= (3, 12):
+        # The restart worked; do not leave the guard for child processes
+        os.environ.pop(_REEXEC_ENV, None)
+        return True
+    if _REEXEC_ENV in os.environ:
+        print(f"❌ Restarted under python3.12 but still running Python {sys.version.split()[0]}")
+        return False
+    
+    python312_path = _find_python312()
+    if not python312_path:
+        print("❌ Could not find python3.12 executable")
+        return False
+    
+    argv = [python312_path] + sys.argv
+    os.environ[_REEXEC_ENV] = "1"
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if os.name == "posix":
+        os.execv(python312_path, argv)
+    sys.exit(subprocess.run(argv).returncode)
+
+# Usage examples:
+# switch_to_python312()           # Simple version
+# switch_to_python312_advanced()  # Verbose version with more details
+# exec_into_python312()           # Restart the current script under Python 3.12
+'''.encode("utf-8")
+
+# Executables resolved so far. Only hits are stored, so something installed
+# after a failed lookup is found on the next call.
+_found_paths = {}
+
+def _which(name):
+    """Resolve an executable on PATH once per process, without spawning `which`"""
+    if name not in _found_paths:
+        path = shutil.which(name)
+        if path is None:
+            return None
+        _found_paths[name] = path
+    return _found_paths[name]
+
+@lru_cache(maxsize=None)
+def _py312_features():
+    """
+    Report which Python 3.9+/3.11+ features this interpreter has (computed once)
+
+    Nothing is imported or executed: modules are resolved with find_spec.
+    """
+    return {
+        "zoneinfo": importlib.util.find_spec("zoneinfo") is not None,
+        "tomllib": importlib.util.find_spec("tomllib") is not None,
+        "exception_groups": hasattr(builtins, "ExceptionGroup"),
+    }
+
+def _find_python312():
+    """
+    Return the python3.12 path, or None
+
+    A hit is memoized for the process (in _found_paths) and persisted to
+    PYTHON312_CACHE so later runs (CDSW sessions restart often) can skip the
+    PATH scan. A stale entry is removed; a miss is not cached.
+    """
+    if "python3.12" in _found_paths:
+        return _found_paths["python3.12"]
+    try:
+        with open(PYTHON312_CACHE) as f:
+            cached_path = f.read().strip()
+        if cached_path and os.access(cached_path, os.X_OK):
+            _found_paths["python3.12"] = cached_path
+            return cached_path
+        os.unlink(PYTHON312_CACHE)
+    except OSError:
+        pass
+    
+    python312_path = _which("python3.12")
+    if python312_path:
+        try:
+            os.makedirs(os.path.dirname(PYTHON312_CACHE), exist_ok=True)
+            with open(PYTHON312_CACHE, 'w') as f:
+                f.write(python312_path)
+        except OSError:
+            pass  # The cache is only an optimisation
+    return python312_path
+
+def _prepend_path(directory):
+    """Move directory to the front of PATH, dropping empty and duplicate entries"""
+    parts = [directory] + os.environ.get('PATH', '').split(os.pathsep)
+    os.environ['PATH'] = os.pathsep.join(dict.fromkeys(p for p in parts if p))
+
+def _write_if_changed(path, content, mode=0o644):
+    """Write bytes to path unless it already holds exactly that; return True if written"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    _atomic_write(path, content, mode)
+    return True
+
+def _atomic_write(path, data, mode):
+    """
+    Create path with the given mode in one open() and publish it with os.replace
+
+    The data goes out through unbuffered os.write calls on a per-process temp
+    file, which is removed if anything fails. No fsync is issued and O_SYNC is
+    not used: the file is regenerated from a constant template on every run,
+    so durability is not worth a synchronous NFS round-trip.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
 def fix_python_version():
     """Fix Python version in current CDSW session"""
-    print("=" * 50)
-    print("CDSW Python Version Fix")
-    print("=" * 50)
+    # Static report blocks are joined and written once rather than line by line
+    sys.stdout.write("\n".join([
+        _BAR50,
+        "CDSW Python Version Fix",
+        _BAR50,
+        "Before fix:",
+        f"  Python version: {sys.version}",
+        f"  Python executable: {sys.executable}",
+        "",
+    ]) + "\n")
     
-    print(f"Before fix:")
-    print(f"  Python version: {sys.version}")
-    print(f"  Python executable: {sys.executable}")
-    print()
+    # Already running Python 3.12+: nothing to fix
+    if sys.version_info[:2] >= (3, 12):
+        print("✅ Already running Python 3.12, nothing to fix")
+        return True
     
     try:
         # Step 1: Find Python 3.12
         print("1. Finding Python 3.12...")
-        result = subprocess.run(["which", "python3.12"], 
-                              stdout=subprocess.PIPE, 
-                              stderr=subprocess.PIPE, 
-                              text=True, check=True)
-        python312_path = result.stdout.strip()
+        python312_path = _find_python312()
+        if python312_path is None:
+            raise FileNotFoundError("python3.12 not found in PATH")
         print(f"   Found: {python312_path}")
         
         # Step 2: Update sys.executable
@@ -46,34 +344,32 @@ def fix_python_version():
         # Step 3: Update PATH
         print("3. Updating PATH...")
         python312_dir = os.path.dirname(python312_path)
-        current_path = os.environ.get('PATH', '')
-        os.environ['PATH'] = python312_dir + ":" + current_path
+        _prepend_path(python312_dir)
         print(f"   Added to PATH: {python312_dir}")
         
         # Step 4: Set environment variables
         print("4. Setting environment variables...")
-        os.environ['PY_PYTHON'] = '3.12'
-        os.environ['PYTHON_VERSION'] = '3.12'
-        print("   Set PY_PYTHON=3.12")
-        print("   Set PYTHON_VERSION=3.12")
-        
-        print()
-        print("After fix:")
-        print(f"  Python version: {sys.version}")
-        print(f"  Python executable: {sys.executable}")
+        os.environ.update(PY_PYTHON='3.12', PYTHON_VERSION='3.12')
+        sys.stdout.write("\n".join([
+            "   Set PY_PYTHON=3.12",
+            "   Set PYTHON_VERSION=3.12",
+            "",
+            "After fix:",
+            f"  Python version: {sys.version}",
+            f"  Python executable: {sys.executable}",
+            "",
+            "Testing Python 3.12 features...",
+        ]) + "\n")
         
         # Test Python 3.12 features
-        print()
-        print("Testing Python 3.12 features...")
-        try:
-            import zoneinfo
+        if _py312_features()["zoneinfo"]:
             print("✅ zoneinfo module: Available (Python 3.12 confirmed)")
             return True
-        except ImportError:
+        else:
             print("❌ zoneinfo module: Not available")
             return False
             
-    except subprocess.CalledProcessError:
+    except FileNotFoundError:
         print("❌ Error: Could not find python3.12 executable")
         print("   Please check if Python 3.12 is installed:")
         print("   ls -la /usr/bin/python3*")
@@ -82,201 +378,111 @@ def fix_python_version():
         print(f"❌ Error: {e}")
         return False
 
-def verify_fix():
-    """Verify that the fix worked"""
-    print()
-    print("=" * 30)
-    print("Verification")
-    print("=" * 30)
-    
-    print(f"Current Python version: {sys.version}")
-    print(f"Current executable: {sys.executable}")
+def verify_fix(restarted=False):
+    """
+    Verify that the fix worked
+
+    restarted means this process was re-exec'd under python3.12 by main(), so
+    the result applies to this script only, not to the session that ran it.
+    """
+    lines = [
+        "",
+        _BAR30,
+        "Verification",
+        _BAR30,
+        f"Current Python version: {sys.version}",
+        f"Current executable: {sys.executable}",
+    ]
     
-    # Test various Python 3.12+ features
-    tests = [
-        ("zoneinfo module (Python 3.9+)", "import zoneinfo"),
-        ("tomllib module (Python 3.11+)", "import tomllib"),
-        ("Exception groups (Python 3.11+)", "ExceptionGroup('test', [ValueError('test')])"),
+    # Test various Python 3.12+ features without importing or executing them
+    features = _py312_features()
+    probes = [
+        ("zoneinfo module (Python 3.9+)", "zoneinfo"),
+        ("tomllib module (Python 3.11+)", "tomllib"),
+        ("Exception groups (Python 3.11+)", "exception_groups"),
     ]
     
     passed = 0
-    for test_name, test_code in tests:
-        try:
-            exec(test_code)
-            print(f"✅ {test_name}: Available")
+    for test_name, feature in probes:
+        if features[feature]:
+            lines.append(f"✅ {test_name}: Available")
             passed += 1
-        except Exception:
-            print(f"❌ {test_name}: Not available")
+        else:
+            lines.append(f"❌ {test_name}: Not available")
     
-    print()
-    if passed >= 2:
-        print("🎉 SUCCESS: Python 3.12 is now active in your session!")
-        return True
+    lines.append("")
+    if passed >= 2 and restarted:
+        lines.append("🎉 SUCCESS: This script was restarted and now runs under Python 3.12")
+        lines.append("   The notebook kernel that launched it still runs its original Python;")
+        lines.append("   start a Python 3.12 kernel to use 3.12 there.")
+    elif passed >= 2:
+        lines.append("🎉 SUCCESS: Python 3.12 is now active in your session!")
     elif passed >= 1:
-        print("⚠ PARTIAL SUCCESS: Some Python 3.12 features are available")
-        return True
+        lines.append("⚠ PARTIAL SUCCESS: Some Python 3.12 features are available")
     else:
-        print("❌ FAILURE: Python 3.12 features are not available")
-        return False
+        lines.append("❌ FAILURE: Python 3.12 features are not available")
+    sys.stdout.write("\n".join(lines) + "\n")
+    return passed >= 1
 
 def create_helper_function():
     """Create a helper function for future use"""
-    print()
-    print("=" * 30)
-    print("Helper Function")
-    print("=" * 30)
+    sys.stdout.write("\n" + _BAR30 + "\nHelper Function\n" + _BAR30 + "\n")
     
-    helper_code = '''
-def switch_to_python312():
-    """
-    Switch to Python 3.12 in current CDSW session
-    Run this function at the start of your session
-    
-    Compatible with Python 3.6+
-    """
-    import os
-    import sys
-    import subprocess
+    helper_file = os.path.join(HOME, "cdsw_python312_helper.py")
     
     try:
-        # Find Python 3.12
-        # Using stdout and stderr parameters instead of capture_output for Python 3.6 compatibility
-        result = subprocess.run(["which", "python3.12"], 
-                              stdout=subprocess.PIPE, 
-                              stderr=subprocess.PIPE, 
-                              text=True, 
-                              check=True)
-        python312_path = result.stdout.strip()
-        
-        # Update sys.executable
-        sys.executable = python312_path
-        
-        # Update PATH
-        python312_dir = os.path.dirname(python312_path)
-        current_path = os.environ.get('PATH', '')
-        os.environ['PATH'] = python312_dir + ":" + current_path
-        
-        # Set environment variables
-        os.environ['PY_PYTHON'] = '3.12'
-        os.environ['PYTHON_VERSION'] = '3.12'
-        
-        print(f"✅ Switched to Python 3.12: {sys.executable}")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Failed to find python3.12: {e}")
-        print(f"   stderr: {e.stderr}")
-        return False
+        if _write_if_changed(helper_file, _HELPER_PY):
+            status = f"✅ Created helper function file: {helper_file}"
+        else:
+            status = f"✅ Helper function file already up to date: {helper_file}"
+        sys.stdout.write("\n".join([
+            status,
+            "   Usage in CDSW:",
+            "   from cdsw_python312_helper import switch_to_python312",
+            "   switch_to_python312()",
+        ]) + "\n")
+        return helper_file
     except Exception as e:
-        print(f"❌ Failed to switch: {e}")
-        return False
+        print(f"❌ Error creating helper file: {e}")
+        return None
 
-def switch_to_python312_advanced():
+def main(reexec=False):
     """
-    Advanced version with more detailed error handling and fallbacks
+    Main function
+
+    reexec is only set when this file is run as a script: the process is then
+    replaced with python3.12 after the fix. It is off by default so calling
+    main() from a notebook kernel never exec's the kernel.
     """
-    import os
-    import sys
-    import subprocess
-    
-    print("=== Switching to Python 3.12 ===")
-    print(f"Current Python version: {sys.version}")
-    print(f"Current executable: {sys.executable}")
-    
-    # Try to find Python 3.12
-    python312_path = None
+    # Set when this process is the python3.12 re-exec below; cleared once 3.12
+    # is confirmed so child processes do not inherit it
+    restarted = _REEXEC_ENV in os.environ
+    if restarted and sys.version_info[:2] >= (3, 12):
+        del os.environ[_REEXEC_ENV]
     
-    # Method 1: Use which command
-    try:
-        result = subprocess.run(["which", "python3.12"], 
-                              stdout=subprocess.PIPE, 
-                              stderr=subprocess.PIPE, 
-                              text=True, 
-                              check=True)
-        python312_path = result.stdout.strip()
-        print(f"Found python3.12: {python312_path}")
-    except subprocess.CalledProcessError:
-        print("which python3.12 failed, trying alternatives...")
-    
-    # Method 2: Check common locations if which failed
-    if not python312_path:
-        common_locations = [
-            "/usr/bin/python3.12",
-            "/usr/local/bin/python3.12",
-            "/opt/python3.12/bin/python3.12"
-        ]
-        
-        for location in common_locations:
-            if os.path.exists(location):
-                python312_path = location
-                print(f"Found python3.12 at: {location}")
-                break
-    
-    if not python312_path:
-        print("❌ Could not find python3.12 executable")
-        print("Please check if Python 3.12 is installed:")
-        print("   ls -la /usr/bin/python3*")
-        return False
-    
-    # Update sys.executable
     original_executable = sys.executable
-    sys.executable = python312_path
-    print(f"Updated sys.executable: {original_executable} → {sys.executable}")
-    
-    # Update PATH
-    python312_dir = os.path.dirname(python312_path)
-    current_path = os.environ.get('PATH', '')
-    old_path = current_path
-    os.environ['PATH'] = python312_dir + ":" + current_path
-    print(f"Updated PATH to prioritize: {python312_dir}")
-    
-    # Set environment variables
-    os.environ['PY_PYTHON'] = '3.12'
-    os.environ['PYTHON_VERSION'] = '3.12'
-    print("Set environment variables: PY_PYTHON=3.12, PYTHON_VERSION=3.12")
-    
-    print(f"New Python version: {sys.version}")
-    
-    # Test Python 3.12 features
-    try:
-        import zoneinfo
-        print("✅ Python 3.12 features are available")
-        print("✅ Switch to Python 3.12 completed successfully!")
-        return True
-    except ImportError:
-        print("⚠ Python 3.12 features not available (may still be using old version)")
-        return True  # Still consider it a success since we updated the paths
-
-# Usage examples:
-# switch_to_python312()           # Simple version
-# switch_to_python312_advanced()  # Verbose version with more details
-'''
-    
-    helper_file = os.path.expanduser("~/cdsw_python312_helper.py")
-    
-    try:
-        with open(helper_file, 'w') as f:
-            f.write(helper_code)
-        print(f"✅ Created helper function file: {helper_file}")
-        print("   Usage in CDSW:")
-        print("   from cdsw_python312_helper import switch_to_python312")
-        print("   switch_to_python312()")
-        return helper_file
-    except Exception as e:
-        print(f"❌ Error creating helper file: {e}")
-        return None
-
-def main():
-    """Main function"""
     success = fix_python_version()
     
+    # fix_python_version only repoints sys.executable; this process is still the
+    # old interpreter. Replace it with python3.12 running this same script, which
+    # then takes the "already running" path and does the verification itself.
+    if (reexec and sys.executable != original_executable and sys.version_info[:2] < (3, 12)
+            and os.name == "posix" and _REEXEC_ENV not in os.environ):
+        print()
+        print(f"Restarting under {sys.executable}...")
+        os.environ[_REEXEC_ENV] = "1"
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    
     if success:
-        verify_fix()
+        verify_fix(restarted=restarted)
         create_helper_function()
         
         print()
-        print("=" * 50)
+        print(_BAR50)
         print("INSTRUCTIONS")
-        print("=" * 50)
+        print(_BAR50)
         print("1. To run this fix in CDSW:")
         print("   !python3 fix_cdsw_python_version.py")
         print()
@@ -290,4 +496,4 @@ def main():
         print("   import zoneinfo  # Should work now")
 
 if __name__ == "__main__":
-    main()
+    main(reexec=True)
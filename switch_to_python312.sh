@@ -5,7 +5,7 @@
 echo "Switching to Python 3.12..."
 
 # Find python3.12
-PYTHON312_PATH=$(which python3.12 2>/dev/null)
+PYTHON312_PATH=$(command -v python3.12)
 
 if [ -z "$PYTHON312_PATH" ]; then
     echo "Error: python3.12 not found in PATH"
@@ -21,8 +21,11 @@ echo "Python 3.12 directory: $PYTHON312_DIR"
 # Save the original PATH
 export ORIGINAL_PATH="$PATH"
 
-# Update PATH to prioritize Python 3.12
-export PATH="$PYTHON312_DIR:$PATH"
+# Update PATH to prioritize Python 3.12 (skipped if it is already there)
+case ":$PATH:" in
+    *":$PYTHON312_DIR:"*) ;;
+    *) export PATH="$PYTHON312_DIR:$PATH" ;;
+esac
 
 # Set Python version environment variables
 export PY_PYTHON=3.12